@@ -12,6 +12,10 @@ FAISSRetriever = LazyImport(
     "adalflow.components.retriever.faiss_retriever.FAISSRetriever",
     OptionalPackages.FAISS,
 )
+BatchedFAISSRetriever = LazyImport(
+    "adalflow.components.retriever.faiss_retriever.BatchedFAISSRetriever",
+    OptionalPackages.FAISS,
+)
 
 from .reranker_retriever import RerankerRetriever
 
@@ -31,6 +35,7 @@ __all__ = [
     "BM25Retriever",
     "LLMRetriever",
     "FAISSRetriever",
+    "BatchedFAISSRetriever",
     "RerankerRetriever",
     "PostgresRetriever",
     "QdrantRetriever",
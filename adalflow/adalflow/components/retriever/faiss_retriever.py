@@ -5,15 +5,26 @@ from typing import (
     Optional,
     Sequence,
     Union,
-    Dict,
     overload,
     Literal,
     Any,
     Callable,
+    Tuple,
 )
 import numpy as np
 import logging
 import os
+import sys
+import asyncio
+import functools
+import hashlib
+import threading
+import time
+import warnings
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
 
 
 from adalflow.core.retriever import Retriever
@@ -24,27 +35,88 @@ from adalflow.core.types import (
     RetrieverStrQueryType,
     EmbedderOutputType,
 )
-from adalflow.core.functional import normalize_np_array, is_normalized
-
 from adalflow.utils.lazy_import import safe_import, OptionalPackages
+from adalflow.utils.file_io import save_json, load_json
 
+# faiss and torch can each load their own OpenMP runtime on macOS and Windows, which aborts the process
+# unless duplicates are allowed. Only set it before faiss is loaded and never override the user's choice.
+if sys.platform in ["darwin", "win32"]:
+    os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "TRUE")
 safe_import(OptionalPackages.FAISS.value[0], OptionalPackages.FAISS.value[1])
 import faiss
 
 log = logging.getLogger(__name__)
 
-FAISSRetrieverDocumentEmbeddingType = Union[List[float], np.ndarray]  # single embedding
-FAISSRetrieverDocumentsType = Sequence[FAISSRetrieverDocumentEmbeddingType]
+# The embeddings are np.ndarray in float32, lists of floats are deprecated and converted with a warning
+FAISSRetrieverDocumentEmbeddingType = Union[np.ndarray, List[float]]  # single embedding
+FAISSRetrieverDocumentsType = Union[
+    np.ndarray, Sequence[FAISSRetrieverDocumentEmbeddingType]
+]  # shape (n, d)
 
 FAISSRetrieverEmbeddingQueryType = Union[
-    List[float], List[List[float]], np.ndarray
-]  # single embedding or list of embeddings
+    np.ndarray, List[float], List[List[float]]
+]  # single embedding of shape (d,) or embeddings of shape (n, d)
 FAISSRetrieverQueryType = Union[RetrieverStrQueryType, FAISSRetrieverEmbeddingQueryType]
-FAISSRetrieverQueriesType = Sequence[FAISSRetrieverQueryType]
+FAISSRetrieverQueriesType = Union[
+    FAISSRetrieverEmbeddingQueryType, Sequence[RetrieverStrQueryType]
+]
 FAISSRetrieverQueriesStrType = Sequence[RetrieverStrQueryType]
-FAISSRetrieverQueriesEmbeddingType = Sequence[FAISSRetrieverEmbeddingQueryType]
+FAISSRetrieverQueriesEmbeddingType = FAISSRetrieverEmbeddingQueryType
+
+_LIST_EMBEDDINGS_DEPRECATION_MESSAGE = (
+    "Passing embeddings as lists is deprecated and will be removed in a future release, "
+    "pass a float32 np.ndarray of shape (n, d) instead."
+)
+_ADALFLOW_PACKAGE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+
+def _warn_list_embeddings():
+    r"""Warn that embeddings passed as lists are deprecated, attributed to the first caller outside of adalflow.
+
+    The entry points (``__init__``, ``__call__``, ``call``, ``build_index_from_documents``, ...) reach the conversion
+    at different depths, a fixed ``stacklevel`` would point inside the library, where the default filters hide the warning.
+    """
+    stacklevel = 2
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.startswith(
+        _ADALFLOW_PACKAGE_DIR + os.sep
+    ):
+        frame = frame.f_back
+        stacklevel += 1
+    warnings.warn(
+        _LIST_EMBEDDINGS_DEPRECATION_MESSAGE, DeprecationWarning, stacklevel=stacklevel
+    )
 
-os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+def _as_float32_contig(
+    x: Union[np.ndarray, Sequence[Any]], copy: bool = False
+) -> np.ndarray:
+    r"""Convert embeddings to a C-contiguous float32 array of shape (n, d), as faiss expects.
+
+    An np.ndarray is only copied when ``copy`` is True or when its dtype or memory layout differs.
+    A sequence of embeddings is written row by row into a preallocated array, embeddings of different sizes raise a ValueError.
+    A single embedding is returned with shape (1, d).
+    """
+    if isinstance(x, np.ndarray):
+        if copy:
+            x = np.array(x, dtype=np.float32, order="C")
+        else:
+            x = np.ascontiguousarray(x, dtype=np.float32)
+        return x.reshape(1, -1) if x.ndim == 1 else x
+    if np.ndim(x[0]) == 0:  # a single embedding as a list of floats
+        return np.array(x, dtype=np.float32).reshape(1, -1)
+    dimensions = len(x[0])
+    array = np.empty((len(x), dimensions), dtype=np.float32)
+    for i, embedding in enumerate(x):
+        # checked explicitly, numpy would broadcast an embedding of size 1 to the whole row
+        if len(embedding) != dimensions:
+            raise ValueError(
+                f"Embedding {i} has size {len(embedding)}, expected {dimensions}"
+            )
+        array[i] = embedding
+    return array
 
 
 class FAISSRetriever(
@@ -60,8 +132,36 @@ class FAISSRetriever(
             Ensure the vectorizer is exactly the same as the one used to the embeddings in the index.
         top_k (int, optional): Number of chunks to retrieve. Defaults to 5.
         dimensions (Optional[int], optional): Dimension of the embeddings. Defaults to None. It can automatically infer the dimensions from the first chunk.
-        documents (Optional[FAISSRetrieverDocumentType], optional): List of embeddings. Format can be List[List[float]] or List[np.ndarray]. Defaults to None.
+        documents (Optional[FAISSRetrieverDocumentsType], optional): Embeddings as a float32 np.ndarray of shape (n, d), or any documents mapped to embeddings with ``document_map_func``. Defaults to None.
+            Passing List[List[float]] directly is deprecated.
         metric (Literal["cosine", "euclidean", "prob"], optional): The metric to use for the retrieval. Defaults to "prob" which converts cosine similarity to probability.
+        index_type (Literal["flat", "hnsw"], optional): The type of faiss index to build. Defaults to "flat".
+            "flat" does an exact exhaustive scan and is the best choice for small corpora (<10k vectors).
+            "hnsw" builds an approximate graph index (``faiss.IndexHNSWFlat``) with O(log N) search, at the cost of extra graph memory and a slight loss in recall.
+        hnsw_M (int, optional): Number of neighbors per node in the HNSW graph. Defaults to 32.
+        ef_construction (int, optional): Size of the dynamic candidate list when building the HNSW graph. Defaults to 40.
+        ef_search (int, optional): Size of the dynamic candidate list at search time, higher means better recall but slower search. Defaults to 16.
+        normalize (bool, optional): Whether to L2-normalize the document and query embeddings with ``faiss.normalize_L2`` for the "cosine" and "prob" metrics. Defaults to True.
+            Only set it to False if all embeddings are already unit vectors, otherwise the scores are not cosine similarities.
+        quantization (Optional[Literal["sq8", "pq4fs"]], optional): Compress the vectors of the "flat" index to cut the memory traffic of the exhaustive scan. Defaults to None (full float32).
+            "sq8" uses ``faiss.IndexScalarQuantizer`` with 8 bits per dimension (4x smaller), recall stays close to the float32 index.
+            "pq4fs" uses ``faiss.IndexPQFastScan`` with d/2 sub-quantizers of 4 bits (16x smaller, SIMD fast-scan kernels), with a noticeable recall loss,
+            and it needs at least ~1k documents to train. Both are trained on the documents when building the index.
+        embedding_cache_size (int, optional): Max number of query embeddings kept in an LRU cache keyed by the exact query text,
+            so repeated string queries skip the embedder. Defaults to 0 (disabled). The cache is not cleared when the embedder is changed.
+        enable_semantic_cache (bool, optional): Cache the search results of string queries and return them for any later query whose
+            embedding has a cosine similarity of at least ``semantic_cache_threshold`` with a cached one, skipping the index search. Defaults to False.
+        semantic_cache_threshold (float, optional): Minimum query-to-query cosine similarity for a semantic cache hit. Defaults to 0.95.
+        semantic_cache_size (int, optional): Max number of queries in the semantic cache, the least recently used are evicted. Defaults to 5000.
+            Both caches can be shared by concurrent threads, e.g. with :class:`BatchedFAISSRetriever`, they are guarded by a lock.
+        max_batch_size (int, optional): Max number of queries coalesced into one index search by :meth:`acall`. Defaults to 256.
+        max_wait_ms (float, optional): How long :meth:`acall` waits for concurrent queries to join a batch. Defaults to 2.0.
+        num_shards (Optional[int], optional): Number of corpus shards searched in parallel for the "flat" index. Defaults to None,
+            which uses ``min(num_threads or os.cpu_count(), N // 50_000)`` shards, so corpora below 100k vectors are searched in one piece.
+            Only batches with fewer queries than threads are sharded, larger batches keep the query-parallel ``index.search``.
+        num_threads (Optional[int], optional): Number of OpenMP threads faiss uses to search, set with ``faiss.omp_set_num_threads`` on the thread that builds the index and on every thread that searches it. Defaults to None (all cores).
+            In a web server that handles requests concurrently, set it to 1 and parallelize over the requests instead, otherwise each request
+            spawns a thread per core and they thrash each other. It is the opposite tradeoff of ``num_shards``, which parallelizes a single request.
 
     How FAISS works:
 
@@ -73,9 +173,17 @@ class FAISSRetriever(
 
     Note: When the num of chunks are less than top_k, the last columns will be -1
 
+    FAISS parallelizes a flat search over the queries, not over the corpus, so a few queries against a large corpus
+    only keep a few cores busy. For large flat indexes, the corpus is split into shards which are searched in parallel threads
+    (FAISS releases the GIL) with one OpenMP thread each, and the per-shard top k are merged into the global top k.
+
     Other index options:
     - faiss.IndexFlatL2: L2 or Euclidean distance, [-inf, inf]
     - faiss.IndexFlatIP: Inner product of embeddings (inner product of normalized vectors will be cosine similarity, [-1, 1])
+    - faiss.IndexHNSWFlat: Approximate nearest neighbor graph with either of the above metrics, used with ``index_type="hnsw"``.
+    - faiss.IndexScalarQuantizer, faiss.IndexPQFastScan: Exhaustive search on compressed vectors, used with ``quantization``.
+
+    For cosine similarity, the vectors must be L2-normalized, this holds for both the flat and the hnsw index.
 
     We choose cosine similarity and convert it to range [0, 1] by adding 1 and dividing by 2 to simulate probability in [0, 1]
 
@@ -102,9 +210,25 @@ class FAISSRetriever(
             Callable[[Any], FAISSRetrieverDocumentEmbeddingType]
         ] = None,
         metric: Literal["cosine", "euclidean", "prob"] = "prob",
+        index_type: Literal["flat", "hnsw"] = "flat",
+        hnsw_M: int = 32,
+        ef_construction: int = 40,
+        ef_search: int = 16,
+        normalize: bool = True,
+        quantization: Optional[Literal["sq8", "pq4fs"]] = None,
+        embedding_cache_size: int = 0,
+        enable_semantic_cache: bool = False,
+        semantic_cache_threshold: float = 0.95,
+        semantic_cache_size: int = 5000,
+        max_batch_size: int = 256,
+        max_wait_ms: float = 2.0,
+        num_shards: Optional[int] = None,
+        num_threads: Optional[int] = None,
     ):
         super().__init__()
 
+        # guards the embedding and semantic caches, which concurrent searches share
+        self._cache_lock = threading.Lock()
         self.reset_index()
 
         self.dimensions = dimensions
@@ -112,15 +236,59 @@ class FAISSRetriever(
         self.top_k = top_k
         self.metric = metric
         if self.metric == "cosine" or self.metric == "prob":
-            self._faiss_index_type = faiss.IndexFlatIP
+            self._faiss_metric = faiss.METRIC_INNER_PRODUCT
             self._needs_normalized_embeddings = True
         elif self.metric == "euclidean":
-            self._faiss_index_type = faiss.IndexFlatL2
+            self._faiss_metric = faiss.METRIC_L2
             self._needs_normalized_embeddings = False
         else:
             raise ValueError(f"Invalid metric: {self.metric}")
+        if index_type not in ["flat", "hnsw"]:
+            raise ValueError(f"Invalid index_type: {index_type}")
+        self.index_type = index_type
+        self.hnsw_M = hnsw_M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        if quantization not in [None, "sq8", "pq4fs"]:
+            raise ValueError(f"Invalid quantization: {quantization}")
+        if quantization and index_type != "flat":
+            raise ValueError(
+                f"quantization is only supported with the flat index, got {index_type}"
+            )
+        self.quantization = quantization
+        self.normalize = normalize
+        self.num_shards = num_shards
+        self.num_threads = num_threads
+        if num_threads:
+            faiss.omp_set_num_threads(num_threads)
+        self.embedding_cache_size = embedding_cache_size
+        self._embedding_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.embedding_cache_hits: int = 0
+        self.enable_semantic_cache = enable_semantic_cache
+        self.semantic_cache_threshold = semantic_cache_threshold
+        self.semantic_cache_size = semantic_cache_size
+        self.semantic_cache_hits: int = 0
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        # saved next to the faiss index to restore the retriever
+        self.index_keys = [
+            "top_k",
+            "dimensions",
+            "metric",
+            "index_type",
+            "hnsw_M",
+            "ef_construction",
+            "ef_search",
+            "normalize",
+            "quantization",
+            "num_shards",
+            "total_documents",
+        ]
+        self._abatch_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._abatch_queue: Optional[asyncio.Queue] = None
+        self._abatch_task: Optional[asyncio.Task] = None
 
-        if documents:
+        if documents is not None:
             self.documents = documents
             self.build_index_from_documents(documents, document_map_func)
 
@@ -131,6 +299,24 @@ class FAISSRetriever(
         self.xb: np.ndarray = None
         self.dimensions: Optional[int] = None
         self.indexed: bool = False
+        # the index is backed by a read-only memory-mapped file, see load_from_file
+        self.index_read_only: bool = False
+        self._shard_bounds: List[Tuple[int, int]] = []
+        self._shard_executor: Optional[ThreadPoolExecutor] = None
+        self._index_search: Optional[
+            Callable[[np.ndarray, int], Tuple[np.ndarray, np.ndarray]]
+        ] = None
+        self._reset_semantic_cache()
+
+    def _reset_semantic_cache(self):
+        r"""Drop the cached results, they are only valid for the current index."""
+        with self._cache_lock:
+            self._semantic_cache_index: Optional["faiss.IndexIDMap"] = None
+            # id in the cache index -> (top_k, scores, indices), ordered from least to most recently used
+            self._semantic_cache_values: (
+                "OrderedDict[int, Tuple[int, np.ndarray, np.ndarray]]"
+            ) = OrderedDict()
+            self._semantic_cache_next_id: int = 0
 
     def _preprare_faiss_index_from_np_array(self, xb: np.ndarray):
         r"""Prepare the faiss index from the numpy array."""
@@ -142,13 +328,211 @@ class FAISSRetriever(
             ), f"Dimension mismatch: {self.dimensions} != {self.xb.shape[1]}"
         self.total_documents = xb.shape[0]
 
-        self.index = self._faiss_index_type(self.dimensions)
+        self.index = self._create_faiss_index()
+        if not self.index.is_trained:
+            self.index.train(xb)
         self.index.add(xb)
         self.indexed = True
+        self._prepare_search()
+        self._reset_semantic_cache()
+
+    def _prepare_search(self):
+        r"""Pick the search function for the current index, called whenever the index changes.
+
+        For the flat index, it also splits the index into contiguous [start, end) shards for parallel search.
+        Resolving it once saves the per-query dispatch and the lookup of the swig ``index.search`` wrapper.
+        """
+        self._shard_bounds = self._compute_shard_bounds()
+        # reused across searches, the threads of a replaced executor exit once it is garbage collected
+        self._shard_executor = (
+            ThreadPoolExecutor(
+                max_workers=len(self._shard_bounds),
+                thread_name_prefix=f"{self.__class__.__name__}-shard",
+            )
+            if len(self._shard_bounds) > 1
+            else None
+        )
+        self._index_search = (
+            self._sharded_search if len(self._shard_bounds) > 1 else self.index.search
+        )
+        if self.num_threads:
+            self._index_search = functools.partial(
+                self._search_with_num_threads, self._index_search
+            )
+
+    def _search_with_num_threads(
+        self,
+        search: Callable[[np.ndarray, int], Tuple[np.ndarray, np.ndarray]],
+        xq: np.ndarray,
+        top_k: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # the OpenMP thread count is a per-thread setting, so it is applied on the thread that searches
+        faiss.omp_set_num_threads(self.num_threads)
+        return search(xq, top_k)
+
+    def _compute_shard_bounds(self) -> List[Tuple[int, int]]:
+        if self.index_type != "flat" or self.quantization:
+            return []
+        n = self.index.ntotal
+        num_shards = self.num_shards
+        if num_shards is None:
+            num_shards = min(
+                self.num_threads or os.cpu_count() or 1, max(1, n // 50_000)
+            )
+        num_shards = max(1, min(num_shards, n))
+        if num_shards == 1:
+            return []
+        shard_size = -(-n // num_shards)  # ceil division
+        return [
+            (start, min(start + shard_size, n)) for start in range(0, n, shard_size)
+        ]
+
+    def _search(self, xq: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        r"""Search the index, returns the scores and indices in the same format as ``faiss.Index.search``."""
+        return self._index_search(xq, top_k)
+
+    def _search_with_semantic_cache(
+        self, xq: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        r"""Serve queries close to a previous query from the semantic cache, search the index for the rest.
+
+        The cache is read and updated under ``_cache_lock``, the index search of the misses runs outside of it.
+        """
+        if not self.enable_semantic_cache:
+            return self._search(xq, top_k)
+
+        # the cache compares queries by cosine similarity
+        xq_normalized = xq
+        if not self._needs_normalize:
+            xq_normalized = xq.copy()
+            faiss.normalize_L2(xq_normalized)
+
+        nq = xq.shape[0]
+        hits = np.zeros(nq, dtype=bool)
+        D = np.empty((nq, top_k), dtype=np.float32)
+        Ind = np.empty((nq, top_k), dtype=np.int64)
+        with self._cache_lock:
+            if self._semantic_cache_index is None:
+                self._semantic_cache_index = faiss.IndexIDMap(
+                    faiss.IndexFlatIP(xq.shape[1])
+                )
+            cache_index = self._semantic_cache_index
+            if cache_index.ntotal:
+                scores, ids = cache_index.search(xq_normalized, 1)
+                for i, (score, cache_id) in enumerate(zip(scores[:, 0], ids[:, 0])):
+                    if cache_id < 0 or score < self.semantic_cache_threshold:
+                        continue
+                    cached = self._semantic_cache_values.get(int(cache_id))
+                    if cached is None or cached[0] != top_k:
+                        continue
+                    self._semantic_cache_values.move_to_end(int(cache_id))
+                    D[i], Ind[i] = cached[1], cached[2]
+                    hits[i] = True
+                self.semantic_cache_hits += int(hits.sum())
+
+        misses = np.flatnonzero(~hits)
+        if not misses.size:
+            return D, Ind
+        D_missed, Ind_missed = self._search(xq[misses], top_k)
+        D[misses], Ind[misses] = D_missed, Ind_missed
+
+        with self._cache_lock:
+            if cache_index is not self._semantic_cache_index:
+                # the index changed during the search, the results are not cached
+                return D, Ind
+            cache_ids = np.arange(
+                self._semantic_cache_next_id,
+                self._semantic_cache_next_id + misses.size,
+                dtype=np.int64,
+            )
+            self._semantic_cache_next_id += misses.size
+            self._semantic_cache_index.add_with_ids(
+                np.ascontiguousarray(xq_normalized[misses]), cache_ids
+            )
+            for j, cache_id in enumerate(cache_ids.tolist()):
+                self._semantic_cache_values[cache_id] = (
+                    top_k,
+                    D_missed[j].copy(),
+                    Ind_missed[j].copy(),
+                )
+            evicted_ids = []
+            while len(self._semantic_cache_values) > self.semantic_cache_size:
+                evicted_ids.append(self._semantic_cache_values.popitem(last=False)[0])
+            if evicted_ids:
+                self._semantic_cache_index.remove_ids(
+                    np.array(evicted_ids, dtype=np.int64)
+                )
+        return D, Ind
+
+    def _sharded_search(
+        self, xq: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        r"""Search each shard of the flat index in a thread and merge the per-shard top k.
+
+        Sharding only pays off for a few queries, a batch of at least as many queries as threads
+        is searched with ``index.search``, which already parallelizes over the queries on every core.
+        """
+        num_threads = self.num_threads or os.cpu_count() or 1
+        if xq.shape[0] >= max(num_threads, len(self._shard_bounds)):
+            return self.index.search(xq, top_k)
+        # zero-copy view of the vectors stored in the flat index
+        xb = faiss.rev_swig_ptr(
+            self.index.get_xb(), self.index.ntotal * self.index.d
+        ).reshape(self.index.ntotal, self.index.d)
+
+        def search_shard(bounds: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+            start, end = bounds
+            # the shards already saturate the cores, avoid oversubscription
+            faiss.omp_set_num_threads(1)
+            D, Ind = faiss.knn(xq, xb[start:end], top_k, metric=self._faiss_metric)
+            np.add(Ind, start, out=Ind, where=Ind >= 0)
+            return D, Ind
+
+        results = list(self._shard_executor.map(search_shard, self._shard_bounds))
+
+        D = np.concatenate([r[0] for r in results], axis=1)
+        Ind = np.concatenate([r[1] for r in results], axis=1)
+        # higher is better for inner product, lower is better for L2
+        keys = -D if self._faiss_metric == faiss.METRIC_INNER_PRODUCT else D
+        # O(n) selection of the global top k, then only the top k are sorted
+        candidates = np.argpartition(keys, top_k - 1, axis=1)[:, :top_k]
+        order = np.take_along_axis(
+            candidates,
+            np.argsort(np.take_along_axis(keys, candidates, axis=1), axis=1),
+            axis=1,
+        )
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(
+            Ind, order, axis=1
+        )
+
+    def _create_faiss_index(self) -> "faiss.Index":
+        r"""Create an empty faiss index according to the ``index_type`` and ``metric``."""
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(
+                self.dimensions, self.hnsw_M, self._faiss_metric
+            )
+            index.hnsw.efConstruction = self.ef_construction
+            index.hnsw.efSearch = self.ef_search
+            return index
+        if self.quantization == "sq8":
+            return faiss.IndexScalarQuantizer(
+                self.dimensions, faiss.ScalarQuantizer.QT_8bit, self._faiss_metric
+            )
+        if self.quantization == "pq4fs":
+            if self.dimensions % 2:
+                raise ValueError(
+                    f"pq4fs quantization needs even dimensions, got {self.dimensions}"
+                )
+            return faiss.IndexPQFastScan(
+                self.dimensions, self.dimensions // 2, 4, self._faiss_metric
+            )
+        if self._faiss_metric == faiss.METRIC_INNER_PRODUCT:
+            return faiss.IndexFlatIP(self.dimensions)
+        return faiss.IndexFlatL2(self.dimensions)
 
     def build_index_from_documents(
         self,
-        documents: Sequence[Any],
+        documents: Union[FAISSRetrieverDocumentsType, Sequence[Any]],
         document_map_func: Optional[
             Callable[[Any], FAISSRetrieverDocumentEmbeddingType]
         ] = None,
@@ -156,34 +540,22 @@ class FAISSRetriever(
         r"""Build index from embeddings.
 
         Args:
-            documents: List of embeddings. Format can be List[List[float]] or List[np.ndarray]
+            documents: Embeddings as a float32 np.ndarray of shape (n, d). List[List[float]] or List[np.ndarray] is deprecated.
 
-        If you are using Document format, pass them as [doc.vector for doc in documents]
+        If you are using Document format, pass them with ``document_map_func=lambda doc: doc.vector``
         """
+        if document_map_func is None and not isinstance(documents, np.ndarray):
+            _warn_list_embeddings()
         if document_map_func:
             assert callable(document_map_func), "document_map_func should be callable"
             documents = [document_map_func(doc) for doc in documents]
         try:
             self.documents = documents
 
-            # convert to numpy array
-            if not isinstance(documents, np.ndarray) and isinstance(
-                documents[0], Sequence
-            ):
-                # ensure all the embeddings are of the same size
-                assert all(
-                    len(doc) == len(documents[0]) for doc in documents
-                ), "All embeddings should be of the same size"
-                self.xb = np.array(documents, dtype=np.float32)
-            else:
-                self.xb = documents
-            if self._needs_normalized_embeddings:
-                first_vector = self.xb[0]
-                if not is_normalized(first_vector):
-                    log.warning(
-                        "Embeddings are not normalized, normalizing the embeddings"
-                    )
-                    self.xb = normalize_np_array(self.xb)
+            # copy when normalizing in place, so the caller's data is never modified
+            self.xb = _as_float32_contig(documents, copy=self._needs_normalize)
+            if self._needs_normalize:
+                faiss.normalize_L2(self.xb)
 
             self._preprare_faiss_index_from_np_array(self.xb)
             log.info(f"Index built with {self.total_documents} chunks")
@@ -193,35 +565,94 @@ class FAISSRetriever(
             self.reset_index()
             raise e
 
+    def add_documents(
+        self,
+        documents: Union[FAISSRetrieverDocumentsType, Sequence[Any]],
+        document_map_func: Optional[
+            Callable[[Any], FAISSRetrieverDocumentEmbeddingType]
+        ] = None,
+    ):
+        r"""Add embeddings to the existing index without rebuilding it.
+
+        The new documents get the indices following the existing ones. When no index is built yet, it builds the index.
+        ``documents`` and ``xb`` are reset to None instead of growing with each add, as the index holds all the embeddings.
+
+        Args:
+            documents: Embeddings as a float32 np.ndarray of shape (n, d). List[List[float]] or List[np.ndarray] is deprecated.
+        """
+        if not self.indexed:
+            self.build_index_from_documents(documents, document_map_func)
+            return
+        if self.index_read_only:
+            # faiss aborts the process when it resizes a memory-mapped storage
+            raise ValueError(
+                "The index is memory-mapped read-only, load it with mmap=False to add documents"
+            )
+        if document_map_func is None and not isinstance(documents, np.ndarray):
+            _warn_list_embeddings()
+        if document_map_func:
+            assert callable(document_map_func), "document_map_func should be callable"
+            documents = [document_map_func(doc) for doc in documents]
+
+        xb = _as_float32_contig(documents, copy=self._needs_normalize)
+        assert (
+            self.dimensions == xb.shape[1]
+        ), f"Dimension mismatch: {self.dimensions} != {xb.shape[1]}"
+        if self._needs_normalize:
+            faiss.normalize_L2(xb)
+        self.index.add(xb)
+        self.total_documents = self.index.ntotal
+        # keeping documents and xb in sync would copy the whole corpus on every add
+        self.documents = None
+        self.xb = None
+        self._prepare_search()
+        self._reset_semantic_cache()
+        log.info(f"Added {xb.shape[0]} chunks, index has {self.total_documents} chunks")
+
+    @property
+    def _needs_normalize(self) -> bool:
+        return self._needs_normalized_embeddings and self.normalize
+
     def _convert_cosine_similarity_to_probability(self, D: np.ndarray) -> np.ndarray:
-        D = (D + 1) / 2
-        D = np.round(D, 3)
+        r"""Map cosine similarity in [-1, 1] to [0, 1] with (D + 1) / 2, rounded to 3 decimals.
+
+        The float array returned by ``index.search`` is modified in place to avoid allocating a new array per step.
+        The affine map is folded into the scaling of the rounding, ``round(x, 3) = rint(x * 1000) / 1000``,
+        so it takes four passes over D instead of five.
+        """
+        if not np.issubdtype(D.dtype, np.floating):
+            D = D.astype(np.float32)
+        # (D + 1) / 2 * 1000 = D * 500 + 500
+        np.multiply(D, 500, out=D)
+        np.add(D, 500, out=D)
+        np.rint(D, out=D)
+        np.divide(D, 1000, out=D)
         return D
 
     def _to_retriever_output(
-        self, Ind: np.ndarray, D: np.ndarray
+        self, Ind: np.ndarray, D: np.ndarray, top_k: int
     ) -> RetrieverOutputType:
         r"""Convert the indices and distances to RetrieverOutputType format."""
-        output: RetrieverOutputType = []
         # Step 1: Filter out the -1, -1 columns along with its scores when top_k > len(chunks)
-        if -1 in Ind:
+        if self.index_type == "flat":
+            # exhaustive search always fills the first min(top_k, ntotal) columns
+            if self.total_documents < top_k:
+                D = D[:, : self.total_documents]
+                Ind = Ind[:, : self.total_documents]
+        elif -1 in Ind:
+            # approximate search can miss neighbors in any row
             valid_columns = ~np.any(Ind == -1, axis=0)
 
             D = D[:, valid_columns]
             Ind = Ind[:, valid_columns]
-        # Step 2: processing rows (one query at a time)
-        for row in zip(Ind, D):
-            indices, distances = row
-            # convert from numpy to list
-            retrieved_documents_indices = indices.tolist()
-            retrieved_documents_scores = distances.tolist()
-            output.append(
-                RetrieverOutput(
-                    doc_indices=retrieved_documents_indices,
-                    doc_scores=retrieved_documents_scores,
-                )
-            )
-
+        # Step 2: convert the scores of the remaining columns
+        if self.metric == "prob":
+            D = self._convert_cosine_similarity_to_probability(D)
+        # Step 3: convert from numpy to list once for all rows (one row per query)
+        output: RetrieverOutputType = [
+            RetrieverOutput(doc_indices=indices, doc_scores=scores)
+            for indices, scores in zip(Ind.tolist(), D.tolist())
+        ]
         return output
 
     def retrieve_embedding_queries(
@@ -233,21 +664,78 @@ class FAISSRetriever(
             raise ValueError(
                 "Index is empty. Please set the chunks to build the index from"
             )
-        # check if the input is List, convert to numpy array
+        xq = self._embedding_queries_to_np_array(input)
+        top_k = top_k if top_k else self.top_k
+        D, Ind = self._search(xq, top_k)
+        output: RetrieverOutputType = self._to_retriever_output(Ind, D, top_k)
+        return output
+
+    def _embedding_queries_to_np_array(
+        self, input: FAISSRetrieverQueriesEmbeddingType
+    ) -> np.ndarray:
+        if not isinstance(input, np.ndarray):
+            _warn_list_embeddings()
         try:
-            if not isinstance(input, np.ndarray):
-                xq = np.array(input, dtype=np.float32)
-            else:
-                xq = input
+            xq = _as_float32_contig(input, copy=self._needs_normalize)
+            if self._needs_normalize:
+                faiss.normalize_L2(xq)
         except Exception as e:
             log.error(f"Error converting input to numpy array: {e}")
             raise e
+        return xq
 
-        D, Ind = self.index.search(xq, top_k if top_k else self.top_k)
-        if self.metric == "prob":
-            D = self._convert_cosine_similarity_to_probability(D)
-        output: RetrieverOutputType = self._to_retriever_output(Ind, D)
-        return output
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        r"""Embed the queries with the embedder, reusing the cached embeddings of repeated queries.
+
+        The cache is accessed under ``_cache_lock``, the embedder is called outside of it.
+        """
+        if not self.embedding_cache_size:
+            embeddings: EmbedderOutputType = self.embedder(queries)
+            return self._embeddings_to_np_array(embeddings, len(queries))
+
+        keys = [
+            hashlib.blake2b(q.encode("utf-8"), digest_size=16).digest() for q in queries
+        ]
+        xq = np.empty((len(queries), self.dimensions), dtype=np.float32)
+        missed_positions: List[int] = []
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._embedding_cache.get(key)
+                if cached is None:
+                    missed_positions.append(i)
+                    continue
+                self._embedding_cache.move_to_end(key)
+                xq[i] = cached
+                self.embedding_cache_hits += 1
+
+        if missed_positions:
+            embeddings: EmbedderOutputType = self.embedder(
+                [queries[i] for i in missed_positions]
+            )
+            # the rows of xq for the missed queries are uninitialized until filled
+            xq[missed_positions] = self._embeddings_to_np_array(
+                embeddings, len(missed_positions)
+            )
+            with self._cache_lock:
+                for i in missed_positions:
+                    self._embedding_cache[keys[i]] = xq[i].copy()
+                while len(self._embedding_cache) > self.embedding_cache_size:
+                    self._embedding_cache.popitem(last=False)
+        return xq
+
+    def _embeddings_to_np_array(
+        self, embeddings: EmbedderOutputType, num_queries: int
+    ) -> np.ndarray:
+        r"""Stack the embedder output, raise if the embedder failed or returned other embeddings than one per query."""
+        # raises on an embedder error and on embeddings of different sizes
+        xq = embeddings.as_array()
+        if xq.shape[0] != num_queries or (
+            num_queries and xq.shape[1] != self.dimensions
+        ):
+            raise ValueError(
+                f"Expected {num_queries} embeddings of size {self.dimensions}, got shape {xq.shape}"
+            )
+        return xq
 
     def retrieve_string_queries(
         self,
@@ -267,42 +755,54 @@ class FAISSRetriever(
                 "Index is empty. Please set the chunks to build the index from"
             )
         queries = [input] if isinstance(input, str) else input
-        # filter out empty queries
-        valid_queries: List[str] = []
-        record_map: Dict[int, int] = (
-            {}
-        )  # final index : the position in the initial queries
-        for i, q in enumerate(queries):
-            if not q:
-                log.warning("Empty query found, skipping")
-                continue
-            valid_queries.append(q)
-            record_map[len(valid_queries) - 1] = i
+        valid_queries, valid_positions = self._filter_empty_queries(queries)
         # embed the queries, assume the length fits into a batch.
         try:
-            embeddings: EmbedderOutputType = self.embedder(valid_queries)
-            queries_embeddings: List[List[float]] = [
-                data.embedding for data in embeddings.data
-            ]
-
+            xq = self._embed_queries(valid_queries)
         except Exception as e:
             log.error(f"Error embedding queries: {e}")
             raise e
-        xq = np.array(queries_embeddings, dtype=np.float32)
-        D, Ind = self.index.search(xq, top_k if top_k else self.top_k)
-        D = self._convert_cosine_similarity_to_probability(D)
+        if self._needs_normalize:
+            faiss.normalize_L2(xq)
+        top_k = top_k if top_k else self.top_k
+        D, Ind = self._search_with_semantic_cache(xq, top_k)
+        return self._to_string_queries_output(
+            queries, valid_positions, self._to_retriever_output(Ind, D, top_k)
+        )
 
-        output: RetrieverOutputType = [
-            RetrieverOutput(doc_indices=[], query=query) for query in queries
-        ]
-        retrieved_output: RetrieverOutputType = self._to_retriever_output(Ind, D)
-
-        # fill in the doc_indices and score for valid queries
-        for i, per_query_output in enumerate(retrieved_output):
-            initial_index = record_map[i]
-            output[initial_index].doc_indices = per_query_output.doc_indices
-            output[initial_index].doc_scores = per_query_output.doc_scores
+    def _filter_empty_queries(
+        self, queries: Sequence[str]
+    ) -> Tuple[List[str], np.ndarray]:
+        r"""Returns the non-empty queries and their positions in ``queries``."""
+        valid_positions = np.flatnonzero(
+            np.fromiter((bool(q) for q in queries), dtype=bool, count=len(queries))
+        )
+        if valid_positions.size < len(queries):
+            log.warning(
+                f"{len(queries) - valid_positions.size} empty queries found, skipping"
+            )
+        valid_queries = [queries[i] for i in valid_positions.tolist()]
+        return valid_queries, valid_positions
 
+    def _to_string_queries_output(
+        self,
+        queries: Sequence[str],
+        valid_positions: np.ndarray,
+        retrieved_output: RetrieverOutputType,
+    ) -> RetrieverOutputType:
+        r"""Place the outputs of the valid queries at their positions, empty queries get no documents."""
+        output: RetrieverOutputType = [None] * len(queries)
+        for position, per_query_output in zip(
+            valid_positions.tolist(), retrieved_output
+        ):
+            per_query_output.query = queries[position]
+            output[position] = per_query_output
+        if valid_positions.size < len(queries):
+            for position, per_query_output in enumerate(output):
+                if per_query_output is None:
+                    output[position] = RetrieverOutput(
+                        doc_indices=[], query=queries[position]
+                    )
         return output
 
     @overload
@@ -340,12 +840,309 @@ class FAISSRetriever(
         else:
             return self.retrieve_embedding_queries(input, top_k)
 
+    async def acall(
+        self,
+        input: FAISSRetrieverQueriesType,
+        top_k: Optional[int] = None,
+    ) -> RetrieverOutputType:
+        r"""Async version of :meth:`call`, concurrent calls are coalesced into one index search.
+
+        Queries arriving within ``max_wait_ms`` of each other, up to ``max_batch_size`` queries, are stacked and searched
+        in a single ``index.search`` call in the default executor, so the corpus is streamed once for the whole batch instead
+        of once per call. FAISS search is thread-safe on a read-only index and releases the GIL, so the event loop keeps running meanwhile.
+
+        String queries are embedded with :meth:`Embedder.acall`, the embedding and semantic caches are only used by :meth:`call`.
+        """
+        assert (
+            self.indexed
+        ), "Index is not built. Please build the index using build_index_from_documents"
+        if self.index.ntotal == 0:
+            raise ValueError(
+                "Index is empty. Please set the chunks to build the index from"
+            )
+        top_k = top_k if top_k else self.top_k
+        if isinstance(input, str) or (
+            isinstance(input, Sequence) and isinstance(input[0], str)
+        ):
+            assert self.embedder, "Embedder is not provided"
+            queries = [input] if isinstance(input, str) else input
+            valid_queries, valid_positions = self._filter_empty_queries(queries)
+            try:
+                embeddings: EmbedderOutputType = await self.embedder.acall(
+                    valid_queries
+                )
+                xq = self._embeddings_to_np_array(embeddings, len(valid_queries))
+            except Exception as e:
+                log.error(f"Error embedding queries: {e}")
+                raise e
+            if self._needs_normalize:
+                faiss.normalize_L2(xq)
+            D, Ind = await self._abatched_search(xq, top_k)
+            return self._to_string_queries_output(
+                queries, valid_positions, self._to_retriever_output(Ind, D, top_k)
+            )
+
+        xq = self._embedding_queries_to_np_array(input)
+        D, Ind = await self._abatched_search(xq, top_k)
+        return self._to_retriever_output(Ind, D, top_k)
+
+    async def _abatched_search(
+        self, xq: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        r"""Queue the queries for the batching task of the running loop and wait for their results."""
+        # a query of another width would fail the whole batch it is stacked with
+        self._check_query_dimensions(xq)
+        loop = asyncio.get_running_loop()
+        if (
+            self._abatch_loop is not loop
+            or self._abatch_task is None
+            or self._abatch_task.done()
+        ):
+            self._abatch_loop = loop
+            self._abatch_queue = asyncio.Queue()
+            self._abatch_task = loop.create_task(
+                self._abatch_worker(self._abatch_queue)
+            )
+        future = loop.create_future()
+        await self._abatch_queue.put((xq, top_k, future))
+        return await future
+
+    async def _abatch_worker(self, queue: asyncio.Queue):
+        r"""Drain the queue into batches, search each batch once and resolve the futures with their rows."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            num_queries = batch[0][0].shape[0]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while num_queries < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                num_queries += item[0].shape[0]
+
+            # any failure must resolve the futures, otherwise their callers wait forever
+            try:
+                # search once with the largest top_k, the smaller ones are prefixes of it
+                top_k = max(item[1] for item in batch)
+                xq = np.concatenate([item[0] for item in batch])
+                D, Ind = await loop.run_in_executor(None, self._search, xq, top_k)
+            except Exception as e:
+                self._set_batch_exception(batch, e)
+                continue
+            self._set_batch_results(batch, D, Ind)
+
+    def _check_query_dimensions(self, xq: np.ndarray):
+        if xq.ndim != 2 or xq.shape[1] != self.dimensions:
+            raise ValueError(
+                f"Query dimension mismatch: expected {self.dimensions}, got shape {xq.shape}"
+            )
+
+    @staticmethod
+    def _set_batch_results(batch: List[Tuple], D: np.ndarray, Ind: np.ndarray):
+        r"""Resolve the future of each (xq, top_k, future) in the batch with its rows of the batch search."""
+        start = 0
+        for item_xq, item_top_k, future in batch:
+            end = start + item_xq.shape[0]
+            if not future.done():
+                future.set_result(
+                    (D[start:end, :item_top_k], Ind[start:end, :item_top_k])
+                )
+            start = end
+
+    @staticmethod
+    def _set_batch_exception(batch: List[Tuple], e: Exception):
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+
+    def save_to_file(self, path: str):
+        r"""Save the faiss index to ``path`` and the retriever settings to ``path + ".json"``.
+
+        The documents are not saved, only their embeddings inside the index.
+        """
+        assert (
+            self.indexed
+        ), "Index is not built. Please build the index using build_index_from_documents"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            faiss.write_index(self.index, path)
+            save_json(
+                {key: getattr(self, key) for key in self.index_keys}, path + ".json"
+            )
+        except Exception as e:
+            log.error(f"Error saving the index to file: {e}")
+            raise e
+
+    @classmethod
+    def load_from_file(
+        cls,
+        path: str,
+        embedder: Optional[Embedder] = None,
+        mmap: bool = True,
+        **kwargs,
+    ) -> "FAISSRetriever":
+        r"""Restore a retriever saved with :meth:`save_to_file`.
+
+        Args:
+            path (str): The path of the faiss index.
+            embedder (Embedder, optional): The embedder for string queries, it must be the one used to build the index.
+            mmap (bool, optional): Memory-map the vectors of the index file instead of loading them into memory. Defaults to True.
+                The OS then only pages in the parts of the index that are searched and shares the pages across processes,
+                which also allows to search an index larger than the RAM. It maps the storage of the flat, hnsw and "sq8" indexes,
+                a "pq4fs" index is loaded into memory. The loaded index is read-only, :meth:`add_documents` raises on it.
+            **kwargs: Other arguments of :meth:`__init__`, e.g. the cache settings. They override the saved settings such as ``top_k``.
+        """
+        try:
+            config = load_json(path + ".json")
+            if config is None:
+                raise FileNotFoundError(f"Retriever config {path}.json not found")
+            total_documents = config.pop("total_documents")
+            # the explicit arguments override the saved settings
+            instance = cls(embedder=embedder, **{**config, **kwargs})
+            # IO_FLAG_MMAP only maps inverted lists, IO_FLAG_MMAP_IFC maps the codes of the flat storage
+            io_flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if mmap else 0
+            instance.index = faiss.read_index(path, io_flags)
+        except Exception as e:
+            log.error(f"Error loading the index from file: {e}")
+            raise e
+        if instance.index_type == "hnsw":
+            instance.index.hnsw.efSearch = instance.ef_search
+        instance.total_documents = total_documents
+        instance.indexed = True
+        instance.index_read_only = mmap
+        instance._prepare_search()
+        return instance
+
     def _extra_repr(self) -> str:
         s = f"top_k={self.top_k}"
         if self.metric:
             s += f", metric={self.metric}"
+        if self.index_type != "flat":
+            s += f", index_type={self.index_type}"
+        if self.quantization:
+            s += f", quantization={self.quantization}"
         if self.dimensions:
             s += f", dimensions={self.dimensions}"
-        if self.documents:
+        if self.total_documents:
             s += f", total_documents={self.total_documents}"
         return s
+
+
+class BatchedFAISSRetriever(FAISSRetriever):
+    __doc__ = r"""FAISSRetriever that coalesces the searches of concurrent threads into one index search.
+
+    A flat search streams the whole corpus once per ``index.search`` call, no matter how many queries it has,
+    so 100 threads searching one query each read the corpus 100 times. Here, each search is put on a queue instead
+    and a single worker thread stacks the queries that arrive within ``max_wait_ms``, up to ``max_batch_size`` queries,
+    into one search. Each caller blocks until its rows of the result are ready.
+
+    It fits multi-threaded servers with many small concurrent requests. A lone request waits up to ``max_wait_ms``
+    for company, so keep the single-threaded :class:`FAISSRetriever` for sequential workloads.
+
+    Args:
+        Same as :class:`FAISSRetriever`, ``max_batch_size`` and ``max_wait_ms`` configure the batching.
+
+    The worker thread is stopped when the retriever is garbage collected, or earlier with :meth:`close`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # guards the worker thread and its queue, so a search never lands on the queue of a stopped worker
+        self._batch_thread_lock = threading.Lock()
+        self._batch_queue: Optional[Queue] = None
+        self._batch_thread: Optional[threading.Thread] = None
+        # stops the worker thread when the retriever is garbage collected or closed
+        self._batch_finalizer: Optional[weakref.finalize] = None
+        super().__init__(*args, **kwargs)
+
+    def _search(self, xq: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        r"""Queue the queries for the worker thread and wait for their results."""
+        # a query of another width would fail the whole batch it is stacked with
+        self._check_query_dimensions(xq)
+        future: Future = Future()
+        with self._batch_thread_lock:
+            self._start_batch_thread()
+            self._batch_queue.put((xq, top_k, future))
+        return future.result()
+
+    def _start_batch_thread(self):
+        r"""Start the worker thread if it is not running, the caller holds ``_batch_thread_lock``."""
+        if self._batch_thread is not None and self._batch_thread.is_alive():
+            return
+        self._batch_queue = Queue()
+        # the thread only gets a weak reference, so it does not keep the retriever and its index alive
+        self._batch_thread = threading.Thread(
+            target=self._batch_worker,
+            args=(weakref.ref(self), self._batch_queue),
+            name=f"{self.__class__.__name__}-batcher",
+            daemon=True,
+        )
+        self._batch_finalizer = weakref.finalize(self, self._batch_queue.put, None)
+        self._batch_thread.start()
+
+    @staticmethod
+    def _batch_worker(
+        retriever_ref: "weakref.ReferenceType[BatchedFAISSRetriever]",
+        batch_queue: Queue,
+    ):
+        r"""Drain the queue into batches, search each batch once and resolve the futures with their rows.
+
+        The retriever is only referenced while a batch is processed, its callers keep it alive until then.
+        """
+        while True:
+            item = batch_queue.get()
+            if (
+                item is None
+            ):  # stopped by close() or the garbage collection of the retriever
+                return
+            retriever = retriever_ref()
+            if retriever is None:
+                FAISSRetriever._set_batch_exception(
+                    [item], RuntimeError("The retriever was garbage collected")
+                )
+                return
+            batch = [item]
+            num_queries = item[0].shape[0]
+            deadline = time.monotonic() + retriever.max_wait_ms / 1000
+            while num_queries < retriever.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = batch_queue.get(timeout=timeout)
+                except Empty:
+                    break
+                if item is None:
+                    # finish the current batch first
+                    batch_queue.put(None)
+                    break
+                batch.append(item)
+                num_queries += item[0].shape[0]
+
+            # any failure must resolve the futures, otherwise their callers wait forever
+            try:
+                # search once with the largest top_k, the smaller ones are prefixes of it
+                top_k = max(item[1] for item in batch)
+                xq = np.concatenate([item[0] for item in batch])
+                D, Ind = retriever._index_search(xq, top_k)
+            except Exception as e:
+                FAISSRetriever._set_batch_exception(batch, e)
+                continue
+            finally:
+                # no reference is held while waiting for the next batch
+                del retriever
+            FAISSRetriever._set_batch_results(batch, D, Ind)
+
+    def close(self):
+        r"""Stop the worker thread after the queued searches, a later search starts a new one."""
+        with self._batch_thread_lock:
+            thread, self._batch_thread = self._batch_thread, None
+            if self._batch_finalizer is not None:
+                # puts the stop sentinel, at most once per worker thread
+                self._batch_finalizer()
+        if thread is not None:
+            thread.join()
@@ -25,6 +25,7 @@ from uuid import UUID
 from datetime import datetime
 import uuid
 import logging
+import numpy as np
 
 from adalflow.core.base_data_class import DataClass, required_field
 from adalflow.core.tokenizer import Tokenizer
@@ -183,6 +184,32 @@ class EmbedderOutput(DataClass):
             else False
         )
 
+    def as_array(self, dtype: np.dtype = np.float32) -> np.ndarray:
+        r"""Stack the embeddings into a contiguous array of shape (length, embedding_dim).
+
+        Each embedding is copied straight into a preallocated array, there is no intermediate list of embeddings.
+
+        Returns:
+            np.ndarray: The embeddings, of shape (0, 0) if no embedding is available
+
+        Raises:
+            ValueError: If the embedder reported an error or the embeddings have different sizes.
+        """
+        if self.error:
+            raise ValueError(f"Error embedding the input: {self.error}")
+        if not self.data:
+            return np.empty((0, 0), dtype=dtype)
+        embedding_dim = len(self.data[0].embedding)
+        array = np.empty((len(self.data), embedding_dim), dtype=dtype)
+        for i, data in enumerate(self.data):
+            # numpy would broadcast an embedding of size 1 to the whole row
+            if len(data.embedding) != embedding_dim:
+                raise ValueError(
+                    f"Embedding {i} has size {len(data.embedding)}, expected {embedding_dim}"
+                )
+            array[i] = data.embedding
+        return array
+
 
 EmbedderInputType = Union[str, Sequence[str]]
 EmbedderOutputType = EmbedderOutput
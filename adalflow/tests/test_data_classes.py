@@ -1,11 +1,14 @@
 import pytest
 from uuid import uuid4
+import numpy as np
 
 from adalflow.core.types import (
     UserQuery,
     AssistantResponse,
     DialogTurn,
     Conversation,
+    Embedding,
+    EmbedderOutput,
 )
 
 
@@ -76,3 +79,29 @@ def test_dialog_session_operations():
 
     session.delete_dialog_turn(1)
     assert len(session.dialog_turns) == 1
+
+
+def test_embedder_output_as_array():
+    output = EmbedderOutput(
+        data=[
+            Embedding(embedding=[0.1, 0.2, 0.3], index=0),
+            Embedding(embedding=np.array([0.4, 0.5, 0.6]), index=1),
+        ]
+    )
+    array = output.as_array()
+    assert array.dtype == np.float32
+    assert array.shape == (2, 3)
+    assert array.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(array, [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]], rtol=1e-6)
+    assert EmbedderOutput().as_array().shape == (0, 0)
+
+    with pytest.raises(ValueError, match="rate limited"):
+        EmbedderOutput(data=[], error="rate limited").as_array()
+    ragged = EmbedderOutput(
+        data=[
+            Embedding(embedding=[1.0, 2.0, 3.0], index=0),
+            Embedding(embedding=[5.0], index=1),
+        ]
+    )
+    with pytest.raises(ValueError):
+        ragged.as_array()
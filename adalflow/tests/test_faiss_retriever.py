@@ -1,8 +1,17 @@
+import asyncio
+import gc
+import os
+import tempfile
+import threading
 import unittest
-from unittest.mock import Mock
+import warnings
+import weakref
+from unittest.mock import AsyncMock, Mock, patch
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import faiss
 
-from adalflow.components.retriever import FAISSRetriever
+from adalflow.components.retriever import FAISSRetriever, BatchedFAISSRetriever
 from adalflow.core.embedder import Embedder
 from adalflow.core.functional import normalize_vector
 from adalflow.core.types import (
@@ -15,7 +24,7 @@ from adalflow.core.types import (
 def create_dummy_embeddings(num_embeddings, dim, normalize=True):
     vector = np.random.rand(num_embeddings, dim).astype(np.float32)
     if normalize:
-        vector = normalize_vector(vector)
+        vector = np.array(normalize_vector(vector), dtype=np.float32)
     return vector
 
 
@@ -66,6 +75,296 @@ class TestFAISSRetriever(unittest.TestCase):
         self.assertEqual(len(result[0].doc_indices), self.retriever.top_k)
         self.assertEqual(len(result[0].doc_scores), self.retriever.top_k)
 
+    def test_retrieve_string_queries_with_empty_queries(self):
+        queries = ["", "test query", ""]
+        result = self.retriever.retrieve_string_queries(queries)
+        self.assertEqual(self.embedder.call_args[0][0], ["test query"])
+        self.assertEqual([r.query for r in result], queries)
+        self.assertEqual(result[0].doc_indices, [])
+        self.assertEqual(result[2].doc_indices, [])
+        self.assertEqual(len(result[1].doc_indices), self.retriever.top_k)
+        self.assertEqual(len(result[1].doc_scores), self.retriever.top_k)
+
+    def test_retrieve_string_queries_with_embedding_cache(self):
+        embeddings = np.array(self.embeddings, dtype=np.float32)
+        embedder = Mock(
+            side_effect=lambda queries: EmbedderOutput(
+                data=[Mock(embedding=embeddings[len(q)]) for q in queries]
+            )
+        )
+        retriever = FAISSRetriever(
+            embedder=embedder, dimensions=self.dimensions, embedding_cache_size=2
+        )
+        retriever.build_index_from_documents(embeddings)
+
+        first = retriever.retrieve_string_queries(["a", "bb"])
+        self.assertEqual(embedder.call_count, 1)
+        # "a" is served from the cache, only "ccc" is embedded
+        second = retriever.retrieve_string_queries(["ccc", "a"])
+        self.assertEqual(embedder.call_count, 2)
+        embedder.assert_called_with(["ccc"])
+        self.assertEqual(retriever.embedding_cache_hits, 1)
+        self.assertEqual(second[1].doc_indices, first[0].doc_indices)
+        self.assertEqual(second[0].doc_indices[0], 3)
+        # "bb" was evicted as the least recently used entry
+        self.assertEqual(len(retriever._embedding_cache), 2)
+        retriever.retrieve_string_queries(["bb"])
+        self.assertEqual(embedder.call_count, 3)
+
+    def test_string_queries_raise_on_embedder_error(self):
+        failed = EmbedderOutput(data=[], error="rate limited")
+        embedder = Mock(return_value=failed)
+        embedder.acall = AsyncMock(return_value=failed)
+        for embedding_cache_size in [0, 10]:
+            retriever = FAISSRetriever(
+                embedder=embedder,
+                dimensions=self.dimensions,
+                embedding_cache_size=embedding_cache_size,
+            )
+            retriever.build_index_from_documents(self.embeddings)
+            with self.assertRaisesRegex(ValueError, "rate limited"):
+                retriever.retrieve_string_queries(["a", "bb"])
+            self.assertEqual(len(retriever._embedding_cache), 0)
+        with self.assertRaisesRegex(ValueError, "rate limited"):
+            asyncio.run(retriever.acall(["a", "bb"]))
+
+        # one embedding for two queries
+        embedder.return_value = EmbedderOutput(
+            data=[Mock(embedding=self.embeddings[0])]
+        )
+        with self.assertRaises(ValueError):
+            retriever.retrieve_string_queries(["a", "bb"])
+
+    def test_retrieve_string_queries_with_semantic_cache(self):
+        embeddings = np.array(self.embeddings, dtype=np.float32)
+        query_embeddings = {
+            "query": embeddings[0],
+            "similar query": embeddings[0] + 1e-4,
+            "other query": embeddings[5],
+        }
+        embedder = Mock(
+            side_effect=lambda queries: EmbedderOutput(
+                data=[Mock(embedding=query_embeddings[q]) for q in queries]
+            )
+        )
+        retriever = FAISSRetriever(
+            embedder=embedder,
+            dimensions=self.dimensions,
+            enable_semantic_cache=True,
+            semantic_cache_size=1,
+        )
+        retriever.build_index_from_documents(embeddings)
+        retriever._search = Mock(wraps=retriever._search)
+
+        first = retriever.retrieve_string_queries("query")
+        second = retriever.retrieve_string_queries("similar query")
+        self.assertEqual(retriever._search.call_count, 1)
+        self.assertEqual(retriever.semantic_cache_hits, 1)
+        self.assertEqual(second[0].doc_indices, first[0].doc_indices)
+        self.assertEqual(second[0].doc_scores, first[0].doc_scores)
+        self.assertEqual(second[0].query, "similar query")
+
+        # a different top_k or a dissimilar query is searched in the index
+        retriever.retrieve_string_queries("query", top_k=3)
+        self.assertEqual(retriever._search.call_count, 2)
+        other = retriever.retrieve_string_queries("other query")
+        self.assertEqual(retriever._search.call_count, 3)
+        self.assertEqual(other[0].doc_indices[0], 5)
+        self.assertEqual(retriever._semantic_cache_index.ntotal, 1)
+
+        # rebuilding the index clears the cache
+        retriever.build_index_from_documents(embeddings)
+        self.assertEqual(len(retriever._semantic_cache_values), 0)
+
+    def test_acall_coalesces_concurrent_queries(self):
+        queries = create_dummy_embeddings(4, self.dimensions)
+        expected = [
+            self.retriever.retrieve_embedding_queries(query, top_k)
+            for query, top_k in zip(queries, [2, 3, 5, 5])
+        ]
+        self.retriever._search = Mock(wraps=self.retriever._search)
+
+        async def retrieve_concurrently():
+            return await asyncio.gather(
+                *[
+                    self.retriever.acall(query, top_k)
+                    for query, top_k in zip(queries, [2, 3, 5, 5])
+                ]
+            )
+
+        results = asyncio.run(retrieve_concurrently())
+        self.assertEqual(self.retriever._search.call_count, 1)
+        self.assertEqual(self.retriever._search.call_args[0][0].shape[0], 4)
+        for result, expected_result in zip(results, expected):
+            self.assertEqual(result[0].doc_indices, expected_result[0].doc_indices)
+            self.assertEqual(result[0].doc_scores, expected_result[0].doc_scores)
+
+    def test_acall_rejects_query_of_wrong_dimension(self):
+        queries = create_dummy_embeddings(2, self.dimensions)
+
+        async def retrieve_concurrently():
+            return await asyncio.wait_for(
+                asyncio.gather(
+                    self.retriever.acall(queries[0][:-1]),
+                    self.retriever.acall(queries[1]),
+                    return_exceptions=True,
+                ),
+                timeout=5,
+            )
+
+        wrong_dimension, result = asyncio.run(retrieve_concurrently())
+        self.assertIsInstance(wrong_dimension, ValueError)
+        self.assertEqual(
+            result[0].doc_indices,
+            self.retriever.retrieve_embedding_queries(queries[1])[0].doc_indices,
+        )
+
+    def test_acall_search_error_reaches_callers(self):
+        self.retriever._search = Mock(side_effect=RuntimeError("search failed"))
+
+        async def retrieve():
+            return await asyncio.wait_for(self.retriever.acall(self.embeddings[0]), 5)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(retrieve())
+
+    def test_acall_string_queries(self):
+        self.embedder.acall.return_value = self.embedder.return_value
+        result = asyncio.run(self.retriever.acall(["", "test query"]))
+        self.embedder.acall.assert_called_once_with(["test query"])
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0].doc_indices, [])
+        self.assertEqual(result[1].query, "test query")
+        self.assertEqual(
+            result[1].doc_indices,
+            self.retriever.retrieve_string_queries("test query")[0].doc_indices,
+        )
+
+    def test_batched_retriever_coalesces_concurrent_threads(self):
+        retriever = BatchedFAISSRetriever(
+            embedder=self.embedder, dimensions=self.dimensions, max_wait_ms=100
+        )
+        retriever.build_index_from_documents(self.embeddings)
+        retriever._index_search = Mock(wraps=retriever._index_search)
+        queries = create_dummy_embeddings(4, self.dimensions)
+        top_ks = [2, 3, 5, 5]
+        expected = [
+            self.retriever.retrieve_embedding_queries(query, top_k)
+            for query, top_k in zip(queries, top_ks)
+        ]
+
+        barrier = threading.Barrier(len(queries))
+
+        def retrieve(query, top_k):
+            barrier.wait()
+            return retriever.retrieve_embedding_queries(query, top_k)
+
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            results = list(executor.map(retrieve, queries, top_ks))
+        retriever.close()
+
+        self.assertLess(retriever._index_search.call_count, len(queries))
+        for result, expected_result in zip(results, expected):
+            self.assertEqual(result[0].doc_indices, expected_result[0].doc_indices)
+            self.assertEqual(result[0].doc_scores, expected_result[0].doc_scores)
+
+        # a search after close restarts the worker
+        self.assertEqual(len(retriever.call("test query")[0].doc_indices), 5)
+        retriever.close()
+
+    def test_batched_retriever_rejects_query_of_wrong_dimension(self):
+        retriever = BatchedFAISSRetriever(
+            dimensions=self.dimensions, max_wait_ms=100, documents=self.embeddings
+        )
+        queries = [self.embeddings[0][:-1], self.embeddings[1]]
+        barrier = threading.Barrier(len(queries))
+
+        def retrieve(query):
+            barrier.wait()
+            try:
+                return retriever.retrieve_embedding_queries(query)
+            except ValueError as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            futures = [executor.submit(retrieve, query) for query in queries]
+            wrong_dimension, result = [future.result(timeout=5) for future in futures]
+        self.assertIsInstance(wrong_dimension, ValueError)
+        self.assertEqual(result[0].doc_indices[0], 1)
+
+        # a failing search reaches the callers instead of killing the worker
+        retriever._index_search = Mock(side_effect=RuntimeError("search failed"))
+        with self.assertRaises(RuntimeError):
+            retriever.retrieve_embedding_queries(self.embeddings[0])
+        self.assertTrue(retriever._batch_thread.is_alive())
+        retriever.close()
+
+    def test_batched_retriever_is_garbage_collected_without_close(self):
+        retriever = BatchedFAISSRetriever(
+            dimensions=self.dimensions, documents=self.embeddings
+        )
+        retriever.retrieve_embedding_queries(self.embeddings[0])
+        thread = retriever._batch_thread
+        retriever_ref = weakref.ref(retriever)
+        del retriever
+        gc.collect()
+        self.assertIsNone(retriever_ref())
+        # the worker thread is stopped with it
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+
+    def test_batched_retriever_close_during_searches(self):
+        retriever = BatchedFAISSRetriever(
+            dimensions=self.dimensions, max_wait_ms=0, documents=self.embeddings
+        )
+        other = BatchedFAISSRetriever(dimensions=self.dimensions)
+        self.assertIsNot(retriever._batch_thread_lock, other._batch_thread_lock)
+
+        def retrieve(i):
+            if i % 5 == 0:
+                retriever.close()
+                return None
+            return retriever.retrieve_embedding_queries(self.embeddings[i % 10])
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(retrieve, i) for i in range(200)]
+            # a search queued behind the stop sentinel would never complete
+            results = [future.result(timeout=5) for future in futures]
+        retriever.close()
+        for i, result in enumerate(results):
+            if result is not None:
+                self.assertEqual(result[0].doc_indices[0], i % 10)
+
+    def test_caches_with_concurrent_threads(self):
+        embeddings = np.array(self.embeddings, dtype=np.float32)
+        embedder = Mock(
+            side_effect=lambda queries: EmbedderOutput(
+                data=[Mock(embedding=embeddings[int(q)]) for q in queries]
+            )
+        )
+        retriever = BatchedFAISSRetriever(
+            embedder=embedder,
+            dimensions=self.dimensions,
+            embedding_cache_size=4,
+            enable_semantic_cache=True,
+            semantic_cache_size=4,
+            max_wait_ms=1,
+        )
+        retriever.build_index_from_documents(embeddings)
+        queries = [str(i % self.num_embeddings) for i in range(200)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(retriever.retrieve_string_queries, queries))
+        retriever.close()
+
+        for query, result in zip(queries, results):
+            self.assertEqual(result[0].doc_indices[0], int(query))
+        self.assertLessEqual(len(retriever._embedding_cache), 4)
+        self.assertEqual(
+            retriever._semantic_cache_index.ntotal,
+            len(retriever._semantic_cache_values),
+        )
+
     def test_retrieve_with_empty_index(self):
         empty_retriever = FAISSRetriever(
             embedder=self.embedder, dimensions=self.dimensions
@@ -79,6 +378,12 @@ class TestFAISSRetriever(unittest.TestCase):
         expected = np.array([[1, 0.5, 0]])
         np.testing.assert_array_almost_equal(converted, expected, decimal=3)
 
+    def test_cosine_similarity_conversion_in_place(self):
+        D = np.array([[1.0, 0.2468, -1.0]], dtype=np.float32)
+        converted = self.retriever._convert_cosine_similarity_to_probability(D)
+        self.assertIs(converted, D)
+        np.testing.assert_array_almost_equal(D, [[1.0, 0.623, 0.0]], decimal=5)
+
     def test_reset_index(self):
         self.retriever.reset_index()
         self.assertIsNone(self.retriever.index)
@@ -116,6 +421,275 @@ class TestFAISSRetriever(unittest.TestCase):
         self.assertEqual(len(result[0].doc_indices), retriever.top_k)
         self.assertEqual(len(result[0].doc_scores), retriever.top_k)
 
+    def test_retrieve_with_hnsw_index(self):
+        retriever = FAISSRetriever(
+            embedder=self.embedder,
+            dimensions=self.dimensions,
+            index_type="hnsw",
+            hnsw_M=16,
+            ef_search=32,
+        )
+        retriever.build_index_from_documents(self.embeddings)
+        self.assertIsInstance(retriever.index, faiss.IndexHNSWFlat)
+        self.assertEqual(retriever.index.hnsw.efSearch, 32)
+
+        result = retriever.retrieve_embedding_queries(self.embeddings[0:1])
+        self.assertEqual(len(result[0].doc_indices), retriever.top_k)
+        self.assertEqual(result[0].doc_indices[0], 0)
+
+    def test_build_index_normalizes_embeddings(self):
+        retriever = FAISSRetriever(embedder=self.embedder, dimensions=self.dimensions)
+        non_normalized_embeddings = create_dummy_embeddings(
+            self.num_embeddings, self.dimensions, normalize=False
+        )
+        original = non_normalized_embeddings.copy()
+        retriever.build_index_from_documents(non_normalized_embeddings)
+        # the caller's embeddings are left untouched
+        np.testing.assert_array_equal(non_normalized_embeddings, original)
+        np.testing.assert_allclose(np.linalg.norm(retriever.xb, axis=1), 1.0, rtol=1e-5)
+
+        # an unnormalized query still yields a valid probability
+        result = retriever.retrieve_embedding_queries(original[0:1] * 10)
+        self.assertEqual(result[0].doc_indices[0], 0)
+        self.assertAlmostEqual(result[0].doc_scores[0], 1.0, places=3)
+
+    def test_retrieve_top_k_larger_than_index(self):
+        top_k = self.num_embeddings + 3
+        query_embedding = create_dummy_embeddings(2, self.dimensions)
+        result = self.retriever.retrieve_embedding_queries(query_embedding, top_k)
+        for per_query_output in result:
+            self.assertEqual(len(per_query_output.doc_indices), self.num_embeddings)
+            self.assertEqual(len(per_query_output.doc_scores), self.num_embeddings)
+            self.assertNotIn(-1, per_query_output.doc_indices)
+
+    def test_sharded_search_matches_single_index(self):
+        query_embedding = create_dummy_embeddings(3, self.dimensions)
+        for metric in ["prob", "euclidean"]:
+            single = FAISSRetriever(
+                dimensions=self.dimensions, metric=metric, num_shards=1
+            )
+            sharded = FAISSRetriever(
+                dimensions=self.dimensions, metric=metric, num_shards=3
+            )
+            single.build_index_from_documents(self.embeddings)
+            sharded.build_index_from_documents(self.embeddings)
+            self.assertEqual(len(sharded._shard_bounds), 3)
+
+            executor = sharded._shard_executor
+            for top_k in [5, self.num_embeddings + 2]:
+                # fewer queries than shards are sharded, larger batches use index.search
+                for num_queries, sharded_search in [(2, True), (3, False)]:
+                    expected = single.retrieve_embedding_queries(
+                        query_embedding[:num_queries], top_k
+                    )
+                    with patch.object(faiss, "knn", wraps=faiss.knn) as knn:
+                        result = sharded.retrieve_embedding_queries(
+                            query_embedding[:num_queries], top_k
+                        )
+                    self.assertEqual(knn.call_count, 3 if sharded_search else 0)
+                    for e, r in zip(expected, result):
+                        self.assertEqual(r.doc_indices, e.doc_indices)
+                        np.testing.assert_allclose(
+                            r.doc_scores, e.doc_scores, rtol=1e-5
+                        )
+            # the executor is reused across searches
+            self.assertIs(sharded._shard_executor, executor)
+
+    def test_retrieve_with_quantization(self):
+        embeddings = create_dummy_embeddings(1000, 16)
+        for quantization, index_cls in [
+            ("sq8", faiss.IndexScalarQuantizer),
+            ("pq4fs", faiss.IndexPQFastScan),
+        ]:
+            retriever = FAISSRetriever(dimensions=16, quantization=quantization)
+            retriever.build_index_from_documents(embeddings)
+            self.assertIsInstance(retriever.index, index_cls)
+            self.assertEqual(retriever.total_documents, 1000)
+
+            result = retriever.retrieve_embedding_queries(embeddings[0:2])
+            self.assertEqual(len(result), 2)
+            self.assertEqual(len(result[0].doc_indices), retriever.top_k)
+            if quantization == "sq8":
+                self.assertEqual(result[0].doc_indices[0], 0)
+
+    def test_quantization_requires_flat_index(self):
+        with self.assertRaises(ValueError):
+            FAISSRetriever(
+                dimensions=self.dimensions, index_type="hnsw", quantization="sq8"
+            )
+
+    def test_build_index_from_list_of_embeddings(self):
+        embeddings = np.array(self.embeddings, dtype=np.float32)
+        for documents in [list(embeddings), embeddings.tolist()]:
+            retriever = FAISSRetriever(dimensions=self.dimensions, metric="euclidean")
+            with self.assertWarns(DeprecationWarning):
+                retriever.build_index_from_documents(documents)
+            self.assertEqual(retriever.total_documents, self.num_embeddings)
+            np.testing.assert_allclose(retriever.xb, embeddings, rtol=1e-5)
+
+    def test_list_queries_are_deprecated(self):
+        retriever = FAISSRetriever(
+            dimensions=self.dimensions, top_k=1, documents=self.embeddings
+        )
+        with self.assertWarns(DeprecationWarning):
+            list_output = retriever.retrieve_embedding_queries(
+                self.embeddings[:2].tolist()
+            )
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            output = retriever.retrieve_embedding_queries(self.embeddings[:2])
+            single_output = retriever.retrieve_embedding_queries(self.embeddings[0])
+        self.assertEqual(list_output, output)
+        self.assertEqual(output[0].doc_indices, [0])
+        self.assertEqual(single_output[0].doc_indices, [0])
+
+    def test_list_embeddings_deprecation_points_to_the_caller(self):
+        documents = self.embeddings.tolist()
+        queries = self.embeddings[:2].tolist()
+        retriever = FAISSRetriever(
+            dimensions=self.dimensions, documents=self.embeddings
+        )
+        entry_points = {
+            "__init__": lambda: FAISSRetriever(documents=documents),
+            "build_index_from_documents": lambda: FAISSRetriever().build_index_from_documents(
+                documents
+            ),
+            "add_documents": lambda: retriever.add_documents(documents[:1]),
+            "call": lambda: retriever.call(queries),
+            "__call__": lambda: retriever(queries),
+            "retrieve_embedding_queries": lambda: retriever.retrieve_embedding_queries(
+                queries
+            ),
+        }
+        for name, entry_point in entry_points.items():
+            with self.subTest(entry_point=name):
+                with self.assertWarns(DeprecationWarning) as context:
+                    entry_point()
+                # the default filters only show it when it is attributed to the caller
+                self.assertEqual(context.filename, __file__)
+
+    def test_build_index_with_mismatched_embedding_sizes(self):
+        retriever = FAISSRetriever(dimensions=self.dimensions)
+        for size in [self.dimensions - 1, 1]:
+            documents = [np.ones(self.dimensions), np.ones(size)]
+            with self.assertRaises(ValueError), self.assertWarns(DeprecationWarning):
+                retriever.build_index_from_documents(documents)
+            self.assertIsNone(retriever.index)
+
+    def test_build_index_without_normalization_does_not_copy(self):
+        embeddings = np.array(self.embeddings, dtype=np.float32)
+        retriever = FAISSRetriever(dimensions=self.dimensions, metric="euclidean")
+        retriever.build_index_from_documents(embeddings)
+        self.assertTrue(np.shares_memory(retriever.xb, embeddings))
+
+    def test_save_and_load_from_file(self):
+        query_embedding = create_dummy_embeddings(2, self.dimensions)
+        expected = self.retriever.retrieve_embedding_queries(query_embedding)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "index", "faiss.index")
+            self.retriever.save_to_file(path)
+            for mmap in [True, False]:
+                retriever = FAISSRetriever.load_from_file(
+                    path, embedder=self.embedder, mmap=mmap
+                )
+                self.assertTrue(retriever.indexed)
+                self.assertEqual(retriever.dimensions, self.dimensions)
+                self.assertEqual(retriever.total_documents, self.num_embeddings)
+                self.assertEqual(retriever.top_k, self.retriever.top_k)
+                result = retriever.retrieve_embedding_queries(query_embedding)
+                for r, e in zip(result, expected):
+                    self.assertEqual(r.doc_indices, e.doc_indices)
+                    self.assertEqual(r.doc_scores, e.doc_scores)
+                self.assertEqual(
+                    len(retriever.retrieve_string_queries("test query")[0].doc_indices),
+                    retriever.top_k,
+                )
+                self.assertEqual(retriever.index_read_only, mmap)
+                if os.path.exists("/proc/self/maps"):
+                    with open("/proc/self/maps") as f:
+                        self.assertEqual(path in f.read(), mmap)
+                new_embeddings = create_dummy_embeddings(2, self.dimensions)
+                if mmap:
+                    with self.assertRaises(ValueError):
+                        retriever.add_documents(new_embeddings)
+                else:
+                    retriever.add_documents(new_embeddings)
+                    self.assertEqual(retriever.total_documents, self.num_embeddings + 2)
+                del retriever
+
+            # the shards are views over the memory-mapped storage
+            retriever = FAISSRetriever.load_from_file(path, num_shards=2)
+            result = retriever.retrieve_embedding_queries(query_embedding[:1])
+            self.assertEqual(result[0].doc_indices, expected[0].doc_indices)
+
+            # explicit arguments override the saved settings
+            retriever = FAISSRetriever.load_from_file(path, top_k=2, ef_search=8)
+            self.assertEqual(retriever.top_k, 2)
+            self.assertEqual(len(retriever.call(query_embedding)[0].doc_indices), 2)
+
+    def test_add_documents(self):
+        embeddings = create_dummy_embeddings(15, self.dimensions)
+        for index_type in ["flat", "hnsw"]:
+            retriever = FAISSRetriever(
+                dimensions=self.dimensions, index_type=index_type, num_shards=2
+            )
+            retriever.add_documents(embeddings[:10])
+            self.assertEqual(retriever.total_documents, 10)
+            retriever.add_documents(embeddings[10:])
+            self.assertEqual(retriever.total_documents, 15)
+            self.assertEqual(retriever.index.ntotal, 15)
+            self.assertIsNone(retriever.documents)
+            self.assertIsNone(retriever.xb)
+
+            result = retriever.retrieve_embedding_queries(embeddings[12:13], top_k=15)
+            self.assertEqual(result[0].doc_indices[0], 12)
+            self.assertEqual(sorted(result[0].doc_indices), list(range(15)))
+
+        with self.assertRaises(AssertionError):
+            retriever.add_documents(create_dummy_embeddings(2, self.dimensions + 1))
+
+    def test_num_threads(self):
+        num_threads = faiss.omp_get_max_threads()
+        try:
+            retriever = FAISSRetriever(dimensions=self.dimensions, num_threads=1)
+            self.assertEqual(faiss.omp_get_max_threads(), 1)
+            retriever.build_index_from_documents(self.embeddings)
+            result = retriever.retrieve_embedding_queries(self.embeddings[0:1])
+            self.assertEqual(len(result[0].doc_indices), retriever.top_k)
+        finally:
+            faiss.omp_set_num_threads(num_threads)
+
+    def test_num_threads_applies_to_the_searching_thread(self):
+        retriever = FAISSRetriever(
+            dimensions=self.dimensions, num_threads=2, documents=self.embeddings
+        )
+        max_threads = []
+
+        def search():
+            # a new thread does not inherit the setting of the thread that built the index
+            faiss.omp_set_num_threads(3)
+            retriever.retrieve_embedding_queries(self.embeddings[0])
+            max_threads.append(faiss.omp_get_max_threads())
+
+        thread = threading.Thread(target=search)
+        thread.start()
+        thread.join()
+        self.assertEqual(max_threads, [2])
+
+        batched_retriever = BatchedFAISSRetriever(
+            dimensions=self.dimensions, num_threads=2, documents=self.embeddings
+        )
+        with patch.object(
+            faiss, "omp_set_num_threads", wraps=faiss.omp_set_num_threads
+        ) as omp_set_num_threads:
+            batched_retriever.retrieve_embedding_queries(self.embeddings[0])
+        omp_set_num_threads.assert_called_with(2)
+        batched_retriever.close()
+
+    def test_invalid_index_type(self):
+        with self.assertRaises(ValueError):
+            FAISSRetriever(dimensions=self.dimensions, index_type="unknown")
+
 
 if __name__ == "__main__":
     unittest.main()